@@ -1,20 +1,53 @@
 import asyncio
+import os
+import time
+import uuid
 from typing import Optional, List, Dict, Any, Callable, AsyncGenerator
 from contextlib import AsyncExitStack
 
 import boto3
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
+from blob_store import BlobStore, DOCUMENT_FORMATS, IMAGE_FORMATS, MAX_DOCUMENT_BYTES, MAX_IMAGE_BYTES, describe_blob
+from cassette import Cassette
+from mcp_gateway import GatewayConnection, GatewaySession
+from result_encoding import COMPACT_RESULTS_PROMPT, DEFAULT_COMPACT_THRESHOLD, compact_text, extract_content_parts, parts_to_text
+from usage import UsageTracker, get_process_usage
+
 class AwsClient:
-    def __init__(self, servers_config: dict):
+    def __init__(
+        self,
+        servers_config: dict,
+        gateway_socket: Optional[str] = None,
+        compact_results: bool = False,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+        cassette: Optional[Cassette] = None,
+    ):
         # Initialize session and client objects
         self.server_configs = servers_config
+        # 게이트웨이 데몬 소켓 경로 (설정 시 MCP 서버를 직접 실행하지 않고 게이트웨이 사용)
+        self.gateway_socket = gateway_socket or os.getenv('MCP_GATEWAY_SOCKET')
         self.clients = {}
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-        self.bedrock_client = boto3.client(service_name="bedrock-runtime")
+        # 모델/도구 호출 기록 및 재생 (미지정 시 MCP_CASSETTE 환경 변수 사용)
+        self.cassette = cassette or Cassette.from_env()
+        if self.cassette:
+            self.exit_stack.callback(self.cassette.close)
+        replaying = self.cassette is not None and self.cassette.replaying
+        self.bedrock_client = None if replaying else boto3.client(service_name="bedrock-runtime")
         self.tool_mapping = {}
+        self.usage = UsageTracker()
+        # JSON 도구 결과를 모델에 보내기 전에 압축할지 여부
+        self.compact_results = compact_results
+        self.compact_threshold = compact_threshold
+        # 도구 결과의 바이너리 데이터 (대화 기록에는 핸들만 남김)
+        self.blob_store = BlobStore()
+        self.exit_stack.callback(self.blob_store.close)
+        # 백그라운드 연결 작업과 연결이 끝나기 전 사용할 도구 목록 스냅샷 (connect_in_background 참고)
+        self._connect_task: Optional[asyncio.Task] = None
+        self._tool_catalog: Optional[Dict[str, Any]] = None
 
     # methods will go here
     async def __aenter__(self):
@@ -27,6 +60,14 @@ class AwsClient:
     async def connect_to_server(self):
       """Connect to an MCP server"""
 
+      # 재생 모드에서는 기록된 결과만 사용하므로 서버를 실행하지 않음
+      if self.cassette and self.cassette.replaying:
+        return
+
+      if self.gateway_socket:
+        await self.connect_to_gateway()
+        return
+
       for server_name, config in self.server_configs.items():
         server_params = StdioServerParameters(
             command=config["command"],
@@ -41,8 +82,49 @@ class AwsClient:
         await self.session.initialize()
         self.clients[server_name] =  self.session
 
+    def connect_in_background(self, tool_catalog: Optional[Dict[str, Any]] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        서버 연결을 이벤트 루프의 백그라운드 작업으로 시작합니다.
+        연결이 끝나기 전에는 도구 목록 스냅샷으로 모델 호출을 시작하고, 도구를 실제로 호출할 때만 연결을 기다립니다.
+
+        Args:
+            tool_catalog (dict, optional): load_tool_catalog() 결과 ({"tools", "mapping"}). Defaults to None.
+            loop (asyncio.AbstractEventLoop, optional): 연결 작업을 실행할 이벤트 루프. Defaults to 현재 이벤트 루프.
+        """
+        self._tool_catalog = tool_catalog
+        self._connect_task = (loop or asyncio.get_event_loop()).create_task(self.connect_to_server())
+
+    async def _wait_connected(self):
+        """백그라운드 연결이 진행 중이면 끝날 때까지 기다립니다. (연결 실패 시 예외 발생)"""
+        if self._connect_task is not None:
+            await self._connect_task
+
+    async def connect_to_gateway(self):
+        """게이트웨이 데몬을 통해 공유 MCP 세션에 연결"""
+        connection = GatewayConnection(self.gateway_socket)
+        await connection.connect()
+        self.exit_stack.push_async_callback(connection.close)
+
+        for server_name in await connection.list_servers():
+            self.clients[server_name] = GatewaySession(connection, server_name)
+
 
     async def list_all_tools(self):
+        if self.cassette and self.cassette.replaying:
+            recorded = await self.cassette.replay("tools")
+            self.tool_mapping.update(recorded["mapping"])
+            return recorded["tools"]
+
+        # 백그라운드 연결 중이면 스냅샷의 도구 목록으로 모델 호출을 바로 시작
+        if self._tool_catalog and self._connect_task is not None and not self._connect_task.done():
+            self.tool_mapping.update(self._tool_catalog["mapping"])
+            if self.cassette:
+                recorded = {"tools": self._tool_catalog["tools"], "mapping": self._tool_catalog["mapping"]}
+                self.cassette.record("tools", None, recorded, 0.0)
+            return self._tool_catalog["tools"]
+        await self._wait_connected()
+
+        started = time.perf_counter()
         aggregated_tools = []
         for server_name, session in self.clients.items():
             tools_response = await session.list_tools()
@@ -57,13 +139,27 @@ class AwsClient:
                         }
                     }
                 })
+
+        if self.cassette:
+            recorded = {"tools": aggregated_tools, "mapping": dict(self.tool_mapping)}
+            self.cassette.record("tools", None, recorded, time.perf_counter() - started)
         return aggregated_tools
 
 
     async def call_tool(self, tool_name: str, arguments: dict):
+        request = {"name": tool_name, "arguments": arguments}
+        if self.cassette and self.cassette.replaying:
+            return types.CallToolResult.model_validate(await self.cassette.replay("tool", request))
+
+        await self._wait_connected()
+        started = time.perf_counter()
         server_id = self.tool_mapping.get(tool_name)
         session = self.clients.get(server_id)
         result = await session.call_tool(tool_name, arguments=arguments)
+
+        if self.cassette:
+            recorded = result.model_dump(mode="json", by_alias=True, exclude_none=True)
+            self.cassette.record("tool", request, recorded, time.perf_counter() - started)
         return result
 
 
@@ -79,34 +175,130 @@ class AwsClient:
         Returns:
             dict: Bedrock 응답
         """
-        return self.bedrock_client.converse(
-            modelId="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
-            messages=messages,
-            system=[{"text": system_prompt}],
-            toolConfig={
+        if self.cassette and self.cassette.replaying:
+            return self.cassette.replay_sync("model")
+
+        params = {
+            "modelId": "us.anthropic.claude-3-7-sonnet-20250219-v1:0",
+            "messages": messages,
+            "system": [{"text": system_prompt}],
+            "toolConfig": {
                 "tools": tools
             },
+        }
+
+        started = time.perf_counter()
+        response = self.bedrock_client.converse(**params)
+
+        if self.cassette:
+            self.cassette.record("model", params, response, time.perf_counter() - started)
+        return response
+
+    def _to_tool_result_content(self, parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        도구 결과 파트를 Bedrock toolResult content 블록으로 변환합니다.
+        텍스트는 (설정 시) 압축하고, 지원되는 이미지/문서는 저장된 바이트를 그대로 전달합니다.
+        Bedrock 블록 크기 한도를 넘거나 저장소에서 삭제된 blob은 핸들 참조 텍스트로 대신합니다.
+        """
+        content = []
+        for part in parts:
+            if part["type"] == "text":
+                text = compact_text(part["text"], self.compact_threshold) if self.compact_results else part["text"]
+                content.append({"text": text})
+                continue
+
+            mime_type = part["mime_type"]
+            if mime_type in IMAGE_FORMATS and part["size"] <= MAX_IMAGE_BYTES:
+                block_type, block = "image", {"format": IMAGE_FORMATS[mime_type]}
+            elif mime_type in DOCUMENT_FORMATS and part["size"] <= MAX_DOCUMENT_BYTES:
+                block_type, block = "document", {
+                    "format": DOCUMENT_FORMATS[mime_type],
+                    "name": part["handle"].replace(":", "-"),
+                }
+            else:
+                content.append({"text": describe_blob(part)})
+                continue
+
+            try:
+                block["source"] = {"bytes": self.blob_store.get(part["handle"])}
+            except KeyError:
+                content.append({"text": describe_blob(part)})
+                continue
+            content.append({block_type: block})
+        return content
+
+    def _record_usage(self, response: dict, conversation_id: str, iteration: int, tool_results: list) -> Dict[str, Any]:
+        """Bedrock 응답의 usage 정보를 기록하고 usage 이벤트를 반환합니다."""
+        usage = response.get('usage', {})
+        return self.usage.record(
+            conversation_id,
+            iteration,
+            input_tokens=usage.get('inputTokens', 0),
+            output_tokens=usage.get('outputTokens', 0),
+            cached_tokens=usage.get('cacheReadInputTokens', 0),
+            tool_results=tool_results,
         )
 
-    async def process_query_stream(self, query: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """Process a query using Claude and available tools, streaming the results"""
+    def get_usage(self, conversation_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        토큰 사용량을 조회합니다.
+
+        Args:
+            conversation_id (str, optional): 대화 식별자. 지정하지 않으면 클라이언트 전체 누적값을 반환합니다.
+
+        Returns:
+            dict: 대화별 사용량(totals, calls, tools) 또는 클라이언트/프로세스 누적 사용량.
+                기록이 없는 대화(또는 오래되어 제거된 대화)는 None.
+        """
+        if conversation_id is not None:
+            return self.usage.get_conversation(conversation_id)
+        return {"client": self.usage.get_totals(), "process": get_process_usage()}
+
+    async def process_query_stream(
+        self,
+        query: str,
+        conversation_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Process a query using Claude and available tools, streaming the results
+
+        Args:
+            query (str): 사용자 질의
+            conversation_id (str, optional): 대화 식별자 (토큰 사용량 집계 단위). Defaults to None.
+            history (list, optional): 이전 대화 문맥 [{"role": "user"|"assistant", "content": str}]. Defaults to None.
+        """
+        conversation_id = conversation_id or uuid.uuid4().hex
+        iteration = 0
+        # 다음 모델 호출 전에 프롬프트에 추가된 도구 결과
+        pending_tool_results = []
+
+        # 이전 대화 문맥 (user/assistant 텍스트)
         messages = [
+            {"role": turn["role"], "content": [{"text": turn["content"]}]}
+            for turn in history or []
+            if turn["content"]
+        ]
+        messages.append(
             {
                 "role": "user",
                 "content": [
                     {"text": query}
                 ],
             }
-        ]
+        )
 
         tools = await self.list_all_tools()
         # System prompt for Bedrock
         system_prompt = """당신은 사용자의 요청을 분석하고 적절한 도구를 선택하여 실행하는 에이전트입니다.
 사용 가능한 도구들의 정보가 제공될 것입니다. 각 도구의 기능을 이해하고 사용자의 요청에 가장 적합한 도구를 선택하여 사용해주세요.
 도구 실행 결과를 바탕으로 사용자의 요청에 대한 최종 답변을 자연어로 제공해주세요."""
+        if self.compact_results:
+            system_prompt += "\n" + COMPACT_RESULTS_PROMPT
 
         # Initial Bedrock API call
-        response = self._send_request(messages, system_prompt, tools)
+        response = await asyncio.to_thread(self._send_request, messages, system_prompt, tools)
+        yield self._record_usage(response, conversation_id, iteration, pending_tool_results)
 
         # 도구 호출이 여러 번 발생할 수 있으므로 반복문으로 처리
         while True:
@@ -132,10 +324,21 @@ class AwsClient:
                     try:
                         # 도구 실행
                         result = await self.call_tool(tool_name, tool_args)
-                        result_text = result.content[0].text if result.content and hasattr(result.content[0], 'text') else str(result)
-
-                        # 도구 결과 스트리밍
-                        yield {"type": "tool_result", "name": tool_name, "result": result_text}
+                        result_parts = extract_content_parts(result, self.blob_store)
+                        result_text = parts_to_text(result_parts)
+                        model_content = self._to_tool_result_content(result_parts)
+
+                        # 도구 결과 스트리밍 (바이너리 데이터는 핸들로 참조)
+                        yield {
+                            "type": "tool_result",
+                            "name": tool_name,
+                            "result": result_text,
+                            "parts": result_parts
+                        }
+                        pending_tool_results.append({
+                            "name": tool_name,
+                            "chars": sum(len(block["text"]) for block in model_content if "text" in block)
+                        })
 
                         assistant_message_content.append(content)
 
@@ -150,7 +353,7 @@ class AwsClient:
                                 {
                                     "toolResult": {
                                         "toolUseId": tool_id,
-                                        "content": [{"text": result_text}]
+                                        "content": model_content
                                     }
                                 }
                             ]
@@ -159,6 +362,7 @@ class AwsClient:
                         error_msg = f"도구 실행 중 오류: {str(e)}"
                         # 오류 스트리밍
                         yield {"type": "error", "message": error_msg}
+                        pending_tool_results.append({"name": tool_name, "chars": len(error_msg)})
 
                         # 오류 정보 전달
                         messages.append({
@@ -182,18 +386,18 @@ class AwsClient:
                 break
 
             # 다음 응답 가져오기
-            response = self._send_request(messages, system_prompt, tools)
-
-            # 다음 응답의 텍스트 부분만 추출해서 전송
-            for content in response['output']['message']['content']:
-                if 'text' in content:
-                    # 최종 텍스트 응답 (도구 호출 이후)
-                    yield {"type": "text", "content": content['text'], "final": True}
+            response = await asyncio.to_thread(self._send_request, messages, system_prompt, tools)
+            iteration += 1
+            yield self._record_usage(response, conversation_id, iteration, pending_tool_results)
+            pending_tool_results = []
+            # 다음 응답의 텍스트는 반복문에서 한 번만 전송 (따로 전송하면 같은 텍스트가 두 번 전달됨)
 
         # 최종 완료 신호
         yield {"type": "done"}
 
 
     async def close_all(self):
+        if self._connect_task is not None and not self._connect_task.done():
+            self._connect_task.cancel()
         await self.exit_stack.aclose()
 
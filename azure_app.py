@@ -3,7 +3,12 @@ import asyncio
 import json
 from typing import Dict, Any
 import os
+import uuid
 from azure_client import AzureClient
+from blob_store import describe_blob
+from conversation_store import ConversationStore
+from result_encoding import parts_to_text
+from warmup import ClientWarmer, load_tool_catalog
 
 # MCP 서버 구성 파일을 로드하는 함수
 def load_mcp_config():
@@ -39,6 +44,17 @@ def create_server_config():
 
     return server_config
 
+# MCP 클라이언트 사전 준비 (프로세스당 한 번, 백그라운드에서 패키지 다운로드 및 서버 연결)
+# cache_resource는 첫 세션의 스크립트 실행 시 생성되므로, 배포 시에는 `python warmup.py`를 먼저 실행하여
+# 패키지 캐시와 도구 목록 스냅샷을 준비해 둠 (README 참고)
+@st.cache_resource
+def get_client_warmer():
+    warmer = ClientWarmer(AzureClient, create_server_config(), "azure")
+    warmer.start()
+    return warmer
+
+warmer = get_client_warmer()
+
 # 비동기 이벤트 루프 초기화
 if 'event_loop' not in st.session_state:
     st.session_state.event_loop = asyncio.new_event_loop()
@@ -50,14 +66,56 @@ if 'mcp_client' not in st.session_state:
     st.session_state.tools = None
     st.session_state.connected = False
 
-# 대화 메시지 초기화
+# 대화 저장소 (프로세스 전체에서 공유)
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
+
+store = get_conversation_store()
+
+# 저장된 메시지를 화면 표시용 메시지로 변환하는 함수
+def to_display_messages(messages):
+    return [
+        {"id": message["id"], "role": message["role"], "content": store.resolve(message)}
+        for message in messages
+        if message["role"] in ("user", "assistant")
+    ]
+
+# 대화 메시지 초기화 (URL의 conversation 파라미터로 이전 대화 복원)
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.conversation_id = st.query_params.get("conversation") or uuid.uuid4().hex
+    st.query_params["conversation"] = st.session_state.conversation_id
+    st.session_state.messages = to_display_messages(store.recent(st.session_state.conversation_id))
+
+# 메시지를 저장소에 기록하고 최근 메시지만 세션에 유지하는 함수
+def save_message(role, content, name=None):
+    message = store.append(st.session_state.conversation_id, role, content, name=name)
+    st.session_state.messages.append({"id": message["id"], "role": role, "content": content})
+    del st.session_state.messages[:-store.recent_limit]
 
 # 비동기 함수를 동기적으로 실행하는 헬퍼 함수
 def run_async(coro):
     return st.session_state.event_loop.run_until_complete(coro)
 
+# 미리 준비된 클라이언트와 그 이벤트 루프를 현재 세션에서 사용하도록 설정하는 함수
+def adopt_warm_client(warm):
+    loop, client, tools = warm
+    st.session_state.event_loop.close()
+    st.session_state.event_loop = loop
+    asyncio.set_event_loop(loop)
+    st.session_state.mcp_client = client
+    st.session_state.tools = tools
+    st.session_state.connected = True
+
+# 도구 목록 스냅샷으로 바로 질의를 시작하고 서버 연결은 백그라운드에서 진행하는 클라이언트를 설정하는 함수
+# (도구를 실제로 호출할 때만 연결 완료를 기다림)
+def start_deferred_client(catalog):
+    client = AzureClient(create_server_config())
+    client.connect_in_background(catalog, loop=st.session_state.event_loop)
+    st.session_state.mcp_client = client
+    st.session_state.tools = catalog["tools"]
+    st.session_state.connected = True
+
 # MCP 서버에 연결하는 비동기 함수
 async def connect_servers(server_config):
     # 기존 연결이 있으면 종료
@@ -71,16 +129,21 @@ async def connect_servers(server_config):
     return client, tools
 
 # 응답 스트림을 처리하는 비동기 함수
-async def process_response_stream(client, prompt):
+async def process_response_stream(client, prompt, history):
     full_response = []
+    final_response = []
+    last_usage = None
     # 응답 스트림의 각 청크 처리
-    async for chunk in client.process_query_stream(prompt):
+    async for chunk in client.process_query_stream(prompt, st.session_state.conversation_id, history):
         # 텍스트 응답 처리
         if chunk["type"] == "text":
             # final이 True인 경우만 처리하거나, final이 False인 경우만 처리
             if not chunk.get("final", False):  # 초기 응답만 표시
                 st.markdown(chunk["content"])
                 full_response.append(chunk["content"])
+            else:
+                # 최종 답변은 화면에 표시하지 않지만 다음 질의의 문맥을 위해 저장
+                final_response.append(chunk["content"])
 
         # 도구 호출 처리
         elif chunk["type"] == "tool_call":
@@ -90,12 +153,30 @@ async def process_response_stream(client, prompt):
 
         # 도구 실행 결과 처리
         elif chunk["type"] == "tool_result":
+            # blob 핸들은 클라이언트의 임시 저장소를 가리키므로 영구 기록에는 남기지 않음
+            durable_result = parts_to_text(chunk["parts"], include_handles=False) if "parts" in chunk else chunk["result"]
+            store.append(st.session_state.conversation_id, "tool", durable_result, name=chunk["name"])
             with st.expander(f"🔧 도구 결과: {chunk['name']}", expanded=False):
-                try:
-                    result_json = json.loads(chunk["result"])
-                    st.json(result_json)
-                except:
-                    st.markdown(chunk["result"])
+                # content 블록별로 표시 (JSON 블록은 st.json, 이미지는 blob 저장소에서 읽어 표시)
+                for part in chunk.get("parts", [{"type": "text", "text": chunk["result"]}]):
+                    if part["type"] == "blob":
+                        image = None
+                        if part["mime_type"].startswith("image/"):
+                            try:
+                                image = client.blob_store.get(part["handle"])
+                            except KeyError:
+                                # 저장소에서 삭제된 blob은 참조 정보만 표시
+                                pass
+                        if image is not None:
+                            st.image(image, caption=part["handle"])
+                        else:
+                            st.caption(describe_blob(part))
+                        continue
+                    try:
+                        result_json = json.loads(part["text"])
+                        st.json(result_json)
+                    except:
+                        st.markdown(part["text"])
             # full_response.append(f"\n\n**도구 결과:**\n```\n{chunk['result']}\n```")
 
         # 오류 메시지 처리
@@ -103,8 +184,20 @@ async def process_response_stream(client, prompt):
             st.error(chunk["message"])
             # full_response.append(f"\n\n**오류:** {chunk['message']}")
 
-    # 전체 응답 텍스트 반환
-    return "".join(full_response)
+        # 토큰 사용량 처리
+        elif chunk["type"] == "usage":
+            last_usage = chunk
+
+    # 대화 누적 토큰 사용량 표시
+    if last_usage:
+        totals = last_usage["conversation_totals"]
+        st.caption(
+            f"토큰 사용량 (대화 누적): 입력 {totals['input_tokens']} / "
+            f"출력 {totals['output_tokens']} / 캐시 {totals['cached_tokens']}"
+        )
+
+    # 전체 응답 텍스트 반환 (초기 응답 + 최종 답변)
+    return "\n\n".join(text for text in ("".join(full_response), "".join(final_response)) if text)
 
 # 사이드바 UI 설정 함수
 def setup_sidebar():
@@ -115,14 +208,19 @@ def setup_sidebar():
         # 연결 상태 확인 및 자동 연결
         if not st.session_state.connected and not st.session_state.mcp_client:
             try:
-                with st.spinner("서버에 자동 연결 중..."):
-                    client, tools = run_async(connect_servers(server_config))
-
-                # 세션 상태 업데이트
-                st.session_state.mcp_client = client
-                st.session_state.tools = tools
-                st.session_state.connected = True
-                st.success(f"서버 연결 완료! {len(tools)}개의 도구 사용 가능")
+                # 백그라운드에서 준비된 클라이언트가 있으면 바로 사용
+                warm = warmer.claim()
+                if warm:
+                    adopt_warm_client(warm)
+                    st.success(f"서버 연결 완료! {len(st.session_state.tools)}개의 도구 사용 가능")
+                else:
+                    # 연결이 끝나기 전에는 저장된 도구 목록 스냅샷을 표시
+                    catalog = load_tool_catalog(server_config, "azure")
+                    if catalog:
+                        tool_count = len(catalog["tools"])
+                        st.info(f"백그라운드에서 서버 연결 중... (저장된 도구 목록: {tool_count}개)")
+                    else:
+                        st.info("백그라운드에서 서버 연결 중...")
             except Exception as e:
                 st.error(f"서버 자동 연결 실패: {str(e)}")
                 st.info("아래 연결 버튼을 눌러 수동으로 연결해보세요.")
@@ -163,9 +261,22 @@ def setup_sidebar():
 
         # 대화 초기화 버튼
         if st.button("대화 초기화"):
+            if st.session_state.mcp_client:
+                st.session_state.mcp_client.usage.reset(st.session_state.conversation_id)
             st.session_state.messages = []
+            st.session_state.conversation_id = uuid.uuid4().hex
+            st.query_params["conversation"] = st.session_state.conversation_id
             st.rerun()
 
+        # 이전 대화 불러오기 버튼 (디스크에서 필요할 때만 읽음)
+        if st.session_state.messages and st.button("이전 대화 불러오기"):
+            older = store.history(
+                st.session_state.conversation_id,
+                before_id=st.session_state.messages[0]["id"],
+                roles=["user", "assistant"],
+            )
+            st.session_state.messages[:0] = to_display_messages(older)
+
 # 메인 애플리케이션 함수
 def main():
     st.title("멀티 MCP 클라이언트")
@@ -179,13 +290,37 @@ def main():
 
     # 사용자 입력 처리
     if prompt := st.chat_input("메시지를 입력하세요"):
+        # 백그라운드 연결이 아직 끝나지 않았으면 도구 목록 스냅샷으로 바로 시작하고,
+        # 스냅샷이 없을 때만 연결이 끝날 때까지 대기
+        if not st.session_state.mcp_client:
+            try:
+                warm = warmer.claim()
+            except Exception:
+                warm = None
+            catalog = None if warm else load_tool_catalog(create_server_config(), "azure")
+            if warm:
+                adopt_warm_client(warm)
+            elif catalog:
+                start_deferred_client(catalog)
+            else:
+                with st.spinner("서버 연결을 기다리는 중..."):
+                    try:
+                        warm = warmer.claim(timeout=120)
+                    except Exception:
+                        warm = None
+                if warm:
+                    adopt_warm_client(warm)
+
         # 서버 연결 상태 확인
         if not st.session_state.mcp_client or not st.session_state.connected:
             st.error("서버에 연결되어 있지 않습니다. 사이드바에서 서버 연결을 확인하세요.")
             return
 
+        # 이전 대화 문맥 (저장소의 최근 메시지)
+        history = store.get_context(st.session_state.conversation_id)
+
         # 사용자 메시지 표시
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        save_message("user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
 
@@ -194,14 +329,15 @@ def main():
             try:
                 # 응답 스트림 처리
                 with st.spinner("응답 생성 중..."):
-                    full_content = run_async(process_response_stream(st.session_state.mcp_client, prompt))
+                    full_content = run_async(process_response_stream(st.session_state.mcp_client, prompt, history))
                 # 응답 메시지 저장
-                st.session_state.messages.append({"role": "assistant", "content": full_content})
+                save_message("assistant", full_content)
             except Exception as e:
                 # 오류 처리
                 error_msg = f"오류 발생: {str(e)}"
                 st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                # 오류 응답은 다음 질의의 문맥에서 제외되도록 구분하여 저장
+                save_message("assistant", error_msg, name="error")
                 st.session_state.connected = False
 
 # 애플리케이션 시작점
@@ -1,31 +1,69 @@
 import asyncio
+import base64
+import json
+import time
+import uuid
 from typing import Optional, List, Dict, Any, Callable, AsyncGenerator
 from contextlib import AsyncExitStack
 import os
 from openai import AzureOpenAI
-from mcp import ClientSession, StdioServerParameters
+from openai.types.chat import ChatCompletion
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 from dotenv import load_dotenv
 
+from blob_store import BlobStore, IMAGE_FORMATS, describe_blob
+from cassette import Cassette
+from mcp_gateway import GatewayConnection, GatewaySession
+from result_encoding import COMPACT_RESULTS_PROMPT, DEFAULT_COMPACT_THRESHOLD, compact_text, extract_content_parts, parts_to_text
+from usage import UsageTracker, get_process_usage
+
 # .env 파일 로드
 load_dotenv()
 
+# Azure OpenAI image_url 파트로 전달할 이미지 최대 크기 (초과하면 핸들 참조만 전달)
+MAX_IMAGE_URL_BYTES = 20 * 1024 * 1024
+
 class AzureClient:
-    def __init__(self, servers_config: dict):
+    def __init__(
+        self,
+        servers_config: dict,
+        gateway_socket: Optional[str] = None,
+        compact_results: bool = False,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+        cassette: Optional[Cassette] = None,
+    ):
         # Initialize session and client objects
         self.server_configs = servers_config
+        # 게이트웨이 데몬 소켓 경로 (설정 시 MCP 서버를 직접 실행하지 않고 게이트웨이 사용)
+        self.gateway_socket = gateway_socket or os.getenv('MCP_GATEWAY_SOCKET')
         self.clients = {}
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-
-        # Azure OpenAI 클라이언트 초기화
-        self.client = AzureOpenAI(
+        # 모델/도구 호출 기록 및 재생 (미지정 시 MCP_CASSETTE 환경 변수 사용)
+        self.cassette = cassette or Cassette.from_env()
+        if self.cassette:
+            self.exit_stack.callback(self.cassette.close)
+        replaying = self.cassette is not None and self.cassette.replaying
+
+        # Azure OpenAI 클라이언트 초기화 (재생 모드에서는 사용하지 않음)
+        self.client = None if replaying else AzureOpenAI(
             azure_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT'),
             api_key=os.getenv('AZURE_OPENAI_API_KEY'),
             api_version=os.getenv('AZURE_OPENAI_API_VERSION')
         )
         self.deployment = os.getenv('AZURE_OPENAI_DEPLOYMENT')
         self.tool_mapping = {}
+        self.usage = UsageTracker()
+        # JSON 도구 결과를 모델에 보내기 전에 압축할지 여부
+        self.compact_results = compact_results
+        self.compact_threshold = compact_threshold
+        # 도구 결과의 바이너리 데이터 (대화 기록에는 핸들만 남김)
+        self.blob_store = BlobStore()
+        self.exit_stack.callback(self.blob_store.close)
+        # 백그라운드 연결 작업과 연결이 끝나기 전 사용할 도구 목록 스냅샷 (connect_in_background 참고)
+        self._connect_task: Optional[asyncio.Task] = None
+        self._tool_catalog: Optional[Dict[str, Any]] = None
 
     # methods will go here
     async def __aenter__(self):
@@ -38,6 +76,14 @@ class AzureClient:
     async def connect_to_server(self):
       """Connect to an MCP server"""
 
+      # 재생 모드에서는 기록된 결과만 사용하므로 서버를 실행하지 않음
+      if self.cassette and self.cassette.replaying:
+        return
+
+      if self.gateway_socket:
+        await self.connect_to_gateway()
+        return
+
       for server_name, config in self.server_configs.items():
         server_params = StdioServerParameters(
             command=config["command"],
@@ -52,8 +98,49 @@ class AzureClient:
         await self.session.initialize()
         self.clients[server_name] =  self.session
 
+    def connect_in_background(self, tool_catalog: Optional[Dict[str, Any]] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        서버 연결을 이벤트 루프의 백그라운드 작업으로 시작합니다.
+        연결이 끝나기 전에는 도구 목록 스냅샷으로 모델 호출을 시작하고, 도구를 실제로 호출할 때만 연결을 기다립니다.
+
+        Args:
+            tool_catalog (dict, optional): load_tool_catalog() 결과 ({"tools", "mapping"}). Defaults to None.
+            loop (asyncio.AbstractEventLoop, optional): 연결 작업을 실행할 이벤트 루프. Defaults to 현재 이벤트 루프.
+        """
+        self._tool_catalog = tool_catalog
+        self._connect_task = (loop or asyncio.get_event_loop()).create_task(self.connect_to_server())
+
+    async def _wait_connected(self):
+        """백그라운드 연결이 진행 중이면 끝날 때까지 기다립니다. (연결 실패 시 예외 발생)"""
+        if self._connect_task is not None:
+            await self._connect_task
+
+    async def connect_to_gateway(self):
+        """게이트웨이 데몬을 통해 공유 MCP 세션에 연결"""
+        connection = GatewayConnection(self.gateway_socket)
+        await connection.connect()
+        self.exit_stack.push_async_callback(connection.close)
+
+        for server_name in await connection.list_servers():
+            self.clients[server_name] = GatewaySession(connection, server_name)
+
 
     async def list_all_tools(self):
+        if self.cassette and self.cassette.replaying:
+            recorded = await self.cassette.replay("tools")
+            self.tool_mapping.update(recorded["mapping"])
+            return recorded["tools"]
+
+        # 백그라운드 연결 중이면 스냅샷의 도구 목록으로 모델 호출을 바로 시작
+        if self._tool_catalog and self._connect_task is not None and not self._connect_task.done():
+            self.tool_mapping.update(self._tool_catalog["mapping"])
+            if self.cassette:
+                recorded = {"tools": self._tool_catalog["tools"], "mapping": self._tool_catalog["mapping"]}
+                self.cassette.record("tools", None, recorded, 0.0)
+            return self._tool_catalog["tools"]
+        await self._wait_connected()
+
+        started = time.perf_counter()
         aggregated_tools = []
         for server_name, session in self.clients.items():
             tools_response = await session.list_tools()
@@ -67,13 +154,27 @@ class AzureClient:
                         "parameters": tool.inputSchema
                     }
                 })
+
+        if self.cassette:
+            recorded = {"tools": aggregated_tools, "mapping": dict(self.tool_mapping)}
+            self.cassette.record("tools", None, recorded, time.perf_counter() - started)
         return aggregated_tools
 
 
     async def call_tool(self, tool_name: str, arguments: dict):
+        request = {"name": tool_name, "arguments": arguments}
+        if self.cassette and self.cassette.replaying:
+            return types.CallToolResult.model_validate(await self.cassette.replay("tool", request))
+
+        await self._wait_connected()
+        started = time.perf_counter()
         server_id = self.tool_mapping.get(tool_name)
         session = self.clients.get(server_id)
         result = await session.call_tool(tool_name, arguments=arguments)
+
+        if self.cassette:
+            recorded = result.model_dump(mode="json", by_alias=True, exclude_none=True)
+            self.cassette.record("tool", request, recorded, time.perf_counter() - started)
         return result
 
     def _send_request(
@@ -112,16 +213,101 @@ class AzureClient:
         if response_format:
             params["response_format"] = response_format
 
-        return self.client.chat.completions.create(**params)
+        if self.cassette and self.cassette.replaying:
+            return ChatCompletion.model_validate(self.cassette.replay_sync("model"))
+
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(**params)
+
+        if self.cassette:
+            self.cassette.record("model", params, response.model_dump(mode="json"), time.perf_counter() - started)
+        return response
+
+    def _to_tool_message_content(self, parts: List[Dict[str, Any]]) -> tuple:
+        """
+        도구 결과 파트를 tool 메시지 본문과 이미지 파트 목록으로 변환합니다.
+        텍스트는 (설정 시) 압축하고, blob은 핸들 참조로 표현하며 이미지는 image_url 파트로 만듭니다.
+        """
+        texts = []
+        images = []
+        for part in parts:
+            if part["type"] == "text":
+                texts.append(compact_text(part["text"], self.compact_threshold) if self.compact_results else part["text"])
+                continue
+
+            texts.append(describe_blob(part))
+            if part["mime_type"] in IMAGE_FORMATS and part["size"] <= MAX_IMAGE_URL_BYTES:
+                try:
+                    data = self.blob_store.get(part["handle"])
+                except KeyError:
+                    # 저장소에서 삭제된 blob은 핸들 참조만 전달
+                    continue
+                encoded = base64.b64encode(data).decode("ascii")
+                images.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{part['mime_type']};base64,{encoded}"}
+                })
+        return "\n".join(texts), images
+
+    def _record_usage(self, response: Any, conversation_id: str, iteration: int, tool_results: list) -> Dict[str, Any]:
+        """Azure OpenAI 응답의 usage 정보를 기록하고 usage 이벤트를 반환합니다."""
+        usage = response.usage
+        details = getattr(usage, 'prompt_tokens_details', None) if usage else None
+        return self.usage.record(
+            conversation_id,
+            iteration,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+            cached_tokens=(getattr(details, 'cached_tokens', 0) or 0) if details else 0,
+            tool_results=tool_results,
+        )
+
+    def get_usage(self, conversation_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        토큰 사용량을 조회합니다.
+
+        Args:
+            conversation_id (str, optional): 대화 식별자. 지정하지 않으면 클라이언트 전체 누적값을 반환합니다.
+
+        Returns:
+            dict: 대화별 사용량(totals, calls, tools) 또는 클라이언트/프로세스 누적 사용량.
+                기록이 없는 대화(또는 오래되어 제거된 대화)는 None.
+        """
+        if conversation_id is not None:
+            return self.usage.get_conversation(conversation_id)
+        return {"client": self.usage.get_totals(), "process": get_process_usage()}
 
-    async def process_query_stream(self, query: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """Process a query using Azure OpenAI and available tools, streaming the results"""
+    async def process_query_stream(
+        self,
+        query: str,
+        conversation_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Process a query using Azure OpenAI and available tools, streaming the results
+
+        Args:
+            query (str): 사용자 질의
+            conversation_id (str, optional): 대화 식별자 (토큰 사용량 집계 단위). Defaults to None.
+            history (list, optional): 이전 대화 문맥 [{"role": "user"|"assistant", "content": str}]. Defaults to None.
+        """
+        conversation_id = conversation_id or uuid.uuid4().hex
+        iteration = 0
+        # 다음 모델 호출 전에 프롬프트에 추가된 도구 결과
+        pending_tool_results = []
+
+        # 이전 대화 문맥 (user/assistant 텍스트)
         messages = [
+            {"role": turn["role"], "content": turn["content"]}
+            for turn in history or []
+            if turn["content"]
+        ]
+        messages.append(
             {
                 "role": "user",
                 "content": query
             }
-        ]
+        )
 
         tools = await self.list_all_tools()
         # System prompt for Azure OpenAI
@@ -129,15 +315,21 @@ class AzureClient:
 사용 가능한 도구들의 정보가 제공될 것입니다. 각 도구의 기능을 이해하고 사용자의 요청에 가장 적합한 도구를 선택하여 사용해주세요.
 도구를 사용하기 전에는 사용자가 요청한 내용을 요약하고, 어떤 도구를 왜 사용할지 먼저 사용자에게 설명해줘야 합니다.
 도구 실행 결과를 바탕으로 사용자의 요청에 대한 최종 답변을 자연어로 제공해주세요."""
+        if self.compact_results:
+            system_prompt += "\n" + COMPACT_RESULTS_PROMPT
 
         messages.insert(0, {"role": "system", "content": system_prompt})
 
         while True:
             # Azure OpenAI API 호출
-            response = self._send_request(
+            response = await asyncio.to_thread(
+                self._send_request,
                 messages=messages,
                 tools=tools
             )
+            yield self._record_usage(response, conversation_id, iteration, pending_tool_results)
+            pending_tool_results = []
+            iteration += 1
 
             choice = response.choices[0]
 
@@ -162,15 +354,19 @@ class AzureClient:
 
                 try:
                     # 도구 실행
-                    result = await self.call_tool(tool_name, eval(tool_args))
-                    result_text = result.content[0].text if result.content and hasattr(result.content[0], 'text') else str(result)
+                    result = await self.call_tool(tool_name, json.loads(tool_args) if tool_args else {})
+                    result_parts = extract_content_parts(result, self.blob_store)
+                    result_text = parts_to_text(result_parts)
+                    model_text, model_images = self._to_tool_message_content(result_parts)
 
                     # 도구 결과 스트리밍
                     yield {
                         "type": "tool_result",
                         "name": tool_name,
-                        "result": result_text
+                        "result": result_text,
+                        "parts": result_parts
                     }
+                    pending_tool_results.append({"name": tool_name, "chars": len(model_text)})
 
                     # 도구 결과를 메시지에 추가
                     messages.append({
@@ -187,13 +383,21 @@ class AzureClient:
                     })
                     messages.append({
                         "role": "tool",
-                        "content": result_text,
+                        "content": model_text,
                         "tool_call_id": tool_call.id
                     })
 
+                    # tool 메시지는 텍스트만 지원하므로 이미지는 이어지는 user 메시지로 전달
+                    if model_images:
+                        messages.append({
+                            "role": "user",
+                            "content": [{"type": "text", "text": f"{tool_name} 도구 결과 이미지"}] + model_images
+                        })
+
                 except Exception as e:
                     error_msg = f"도구 실행 중 오류: {str(e)}"
                     yield {"type": "error", "message": error_msg}
+                    pending_tool_results.append({"name": tool_name, "chars": len(error_msg)})
                     messages.append({
                         "role": "tool",
                         "content": error_msg,
@@ -201,7 +405,8 @@ class AzureClient:
                     })
 
         # 최종 응답 생성
-        final_response = self._send_request(
+        final_response = await asyncio.to_thread(
+            self._send_request,
             messages=messages,
             tools=tools,
             tool_choice="none",
@@ -209,6 +414,7 @@ class AzureClient:
             max_tokens=4096,
             temperature=1.0
         )
+        yield self._record_usage(final_response, conversation_id, iteration, pending_tool_results)
 
         if final_response.choices[0].message.content:
             yield {
@@ -223,5 +429,7 @@ class AzureClient:
 
     async def close_all(self):
         """Close all connections"""
+        if self._connect_task is not None and not self._connect_task.done():
+            self._connect_task.cancel()
         await self.exit_stack.aclose()
 
@@ -0,0 +1,199 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+# 메모리에 유지할 blob 총 크기 (초과분은 임시 파일로 이동)
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+# 보관할 blob 최대 개수와 임시 파일 총 크기 (초과 시 오래 사용하지 않은 blob부터 삭제)
+DEFAULT_MAX_BLOBS = 1000
+DEFAULT_DISK_LIMIT = 1024 * 1024 * 1024
+
+# Bedrock 블록별 최대 크기 (초과하면 모델에는 핸들 참조만 전달)
+MAX_IMAGE_BYTES = int(3.75 * 1024 * 1024)
+MAX_DOCUMENT_BYTES = int(4.5 * 1024 * 1024)
+
+# Bedrock image 블록에서 지원하는 형식
+IMAGE_FORMATS = {
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+
+# Bedrock document 블록에서 지원하는 형식
+DOCUMENT_FORMATS = {
+    "application/pdf": "pdf",
+    "text/csv": "csv",
+    "text/html": "html",
+    "text/plain": "txt",
+    "text/markdown": "md",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.ms-excel": "xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+
+
+def describe_blob(part: Dict[str, Any], include_handle: bool = True) -> str:
+    """
+    blob을 프롬프트/기록에 남길 짧은 참조 텍스트로 표현합니다.
+
+    Args:
+        part (dict): blob 파트
+        include_handle (bool, optional): 핸들 포함 여부. 클라이언트 종료 후에도 남는 기록에는
+            (임시 디렉터리가 삭제되어 핸들이 무효가 되므로) False로 지정. Defaults to True.
+    """
+    description = f"[{part['mime_type']} {part['size']} bytes"
+    if include_handle:
+        description += f", {part['handle']}"
+    if part.get("uri"):
+        description += f", {part['uri']}"
+    return description + "]"
+
+
+class BlobStore:
+    """
+    도구 결과의 바이너리 데이터(base64)를 한 번만 디코딩하여 보관하는 저장소
+
+    같은 내용은 해시로 중복 제거되고, 대화 기록에는 "blob:<hash>" 핸들만 남습니다.
+    메모리 사용량이 memory_limit를 넘으면 오래 사용하지 않은 blob부터 임시 파일로 옮기고,
+    blob 수가 max_blobs를 넘거나 임시 파일 크기가 disk_limit를 넘으면 오래 사용하지 않은 blob부터 삭제합니다.
+    삭제된 핸들을 조회하면 KeyError가 발생합니다.
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        spill_dir: Optional[str] = None,
+        max_blobs: int = DEFAULT_MAX_BLOBS,
+        disk_limit: int = DEFAULT_DISK_LIMIT,
+    ):
+        self.memory_limit = memory_limit
+        self.max_blobs = max_blobs
+        self.disk_limit = disk_limit
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="mcp-blobs-")
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._files: Dict[str, str] = {}
+        self._files_size = 0
+        # 사용 순서대로 유지 (가장 오래 사용하지 않은 blob이 앞)
+        self._meta: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _file_path(self, handle: str) -> str:
+        return os.path.join(self.spill_dir, handle.split(":", 1)[1])
+
+    def _write_file(self, handle: str, data: bytes):
+        """blob을 임시 파일로 기록 (lock 보유 상태에서 호출)"""
+        path = self._file_path(handle)
+        with open(path, "wb") as f:
+            f.write(data)
+        self._files[handle] = path
+        self._files_size += len(data)
+
+    def _evict(self):
+        """개수/디스크 한도를 넘으면 오래 사용하지 않은 blob을 삭제 (lock 보유 상태에서 호출)"""
+        while (len(self._meta) > self.max_blobs or self._files_size > self.disk_limit) and len(self._meta) > 1:
+            handle, meta = self._meta.popitem(last=False)
+            data = self._memory.pop(handle, None)
+            if data is not None:
+                self._memory_size -= len(data)
+            path = self._files.pop(handle, None)
+            if path is not None:
+                self._files_size -= meta["size"]
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _cache(self, handle: str, data: bytes):
+        """메모리에 올리고 한도를 넘으면 오래된 blob을 파일로 이동 (lock 보유 상태에서 호출)"""
+        self._memory[handle] = data
+        self._memory_size += len(data)
+
+        while self._memory_size > self.memory_limit and len(self._memory) > 1:
+            old_handle, old_data = self._memory.popitem(last=False)
+            self._memory_size -= len(old_data)
+            if old_handle not in self._files:
+                self._write_file(old_handle, old_data)
+
+        self._evict()
+
+    def put_base64(self, data: str, mime_type: Optional[str], uri: Optional[str] = None) -> Dict[str, Any]:
+        """
+        base64 데이터를 디코딩하여 저장합니다.
+
+        Args:
+            data (str): base64 인코딩된 데이터
+            mime_type (str): MIME 타입
+            uri (str, optional): 리소스 URI. Defaults to None.
+
+        Returns:
+            dict: {"type": "blob", "handle", "mime_type", "size", "uri"}
+        """
+        raw = base64.b64decode(data)
+        handle = f"blob:{hashlib.sha256(raw).hexdigest()[:32]}"
+
+        with self._lock:
+            if handle not in self._meta:
+                self._meta[handle] = {
+                    "type": "blob",
+                    "handle": handle,
+                    "mime_type": mime_type or "application/octet-stream",
+                    "size": len(raw),
+                    "uri": uri,
+                }
+                self._cache(handle, raw)
+            else:
+                self._meta.move_to_end(handle)
+            return dict(self._meta[handle])
+
+    def get(self, handle: str) -> bytes:
+        """blob 데이터를 반환합니다. 파일로 이동된 경우 다시 메모리에 올립니다."""
+        with self._lock:
+            if handle not in self._meta:
+                raise KeyError(f"존재하지 않거나 삭제된 blob: {handle}")
+            self._meta.move_to_end(handle)
+
+            if handle in self._memory:
+                self._memory.move_to_end(handle)
+                return self._memory[handle]
+
+            path = self._files[handle]
+            with open(path, "rb") as f:
+                data = f.read()
+            self._cache(handle, data)
+            return data
+
+    def path(self, handle: str) -> str:
+        """blob을 파일로 사용해야 하는 경우 파일 경로를 반환합니다. (필요 시 파일로 기록)"""
+        with self._lock:
+            if handle not in self._meta:
+                raise KeyError(f"존재하지 않거나 삭제된 blob: {handle}")
+            self._meta.move_to_end(handle)
+
+            if handle not in self._files:
+                self._write_file(handle, self._memory[handle])
+                self._evict()
+            return self._files[handle]
+
+    def meta(self, handle: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            meta = self._meta.get(handle)
+            return dict(meta) if meta else None
+
+    def close(self):
+        """임시 파일을 모두 삭제합니다."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            self._files.clear()
+            self._files_size = 0
+            self._meta.clear()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
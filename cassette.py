@@ -0,0 +1,175 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Optional, Dict, Any
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+def _default(value: Any) -> Any:
+    # 모델 요청에 포함된 이미지/문서 바이트는 크기만 기록
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    return str(value)
+
+
+class _SharedWriter:
+    """같은 경로에 기록하는 Cassette들이 함께 사용하는 파일 핸들 (참조 횟수로 관리)"""
+
+    def __init__(self, path: str):
+        # 이전 세션 기록 뒤에 이어 쓰면 재생 시 이전 응답이 순서대로 재생되므로 새로 기록
+        self.file = open(path, "wb")
+        self.lock = threading.Lock()
+        self.refs = 0
+
+
+# 경로(절대 경로)별 기록용 파일 핸들. 한 프로세스의 여러 클라이언트가 같은 파일에 기록해도
+# 레코드가 섞이지 않도록 하나의 핸들과 lock을 공유
+_writers: Dict[str, _SharedWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def _acquire_writer(path: str) -> _SharedWriter:
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _SharedWriter(path)
+        writer.refs += 1
+        return writer
+
+
+def _release_writer(path: str):
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            return
+        writer.refs -= 1
+        if writer.refs <= 0:
+            del _writers[path]
+            writer.file.close()
+
+
+def _read_entries(path: str):
+    """
+    기록된 항목을 순서대로 읽습니다.
+    프로세스가 기록 중에 종료되어 마지막 레코드가 잘린 경우 그 앞까지만 반환합니다.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                yield json.loads(line)
+        except (EOFError, zlib.error, gzip.BadGzipFile, ValueError):
+            return
+
+
+def _key(kind: str, request: Any) -> str:
+    # 도구 호출은 이름과 인자로 구분하고, 모델/도구 목록 호출은 기록 순서대로 재생
+    if kind == "tool":
+        return json.dumps(request, sort_keys=True, ensure_ascii=False, default=_default)
+    return ""
+
+
+class Cassette:
+    """
+    모델 요청(_send_request), 도구 목록, 도구 호출(call_tool)의 요청/응답과 소요 시간을
+    gzip 압축된 JSON Lines 파일에 기록하고 재생하는 클래스
+
+    레코드마다 독립된 gzip 멤버로 기록하므로 프로세스가 중간에 종료되어도
+    이미 기록된 레코드는 그대로 읽을 수 있습니다.
+
+    재생 시 time_scale로 원래 지연 시간을 조절합니다. (1.0: 원래 속도, 0: 지연 없음)
+    """
+
+    def __init__(self, path: str, mode: str = RECORD, time_scale: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"지원하지 않는 cassette 모드: {mode}")
+
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._entries: Dict[tuple, deque] = defaultdict(deque)
+        self._writer: Optional[_SharedWriter] = None
+
+        if mode == RECORD:
+            self._writer = _acquire_writer(self.path)
+        else:
+            for entry in _read_entries(self.path):
+                self._entries[(entry["kind"], _key(entry["kind"], entry["request"]))].append(entry)
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """MCP_CASSETTE, MCP_CASSETTE_MODE, MCP_CASSETTE_TIME_SCALE 환경 변수로 Cassette를 생성합니다."""
+        path = os.getenv("MCP_CASSETTE")
+        if not path:
+            return None
+        return cls(
+            path,
+            mode=os.getenv("MCP_CASSETTE_MODE", RECORD),
+            time_scale=float(os.getenv("MCP_CASSETTE_TIME_SCALE", "1.0")),
+        )
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def record(self, kind: str, request: Any, response: Any, elapsed: float):
+        """
+        요청/응답 한 쌍을 기록합니다. 기록 모드가 아니거나 닫힌 cassette이면 ValueError가 발생합니다.
+
+        Args:
+            kind (str): "model", "tools", "tool"
+            request: 요청 내용 (JSON 직렬화 가능)
+            response: 응답 내용 (JSON 직렬화 가능)
+            elapsed (float): 소요 시간(초)
+        """
+        entry = {
+            "kind": kind,
+            "offset": round(time.perf_counter() - self._started - elapsed, 6),
+            "elapsed": round(elapsed, 6),
+            "request": request,
+            "response": response,
+        }
+        writer = self._writer
+        if writer is None:
+            raise ValueError(f"기록 모드가 아니거나 닫힌 cassette입니다: {self.path}")
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=_default)
+        data = gzip.compress((line + "\n").encode("utf-8"))
+        with writer.lock:
+            writer.file.write(data)
+            writer.file.flush()
+
+    def _next(self, kind: str, request: Any) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get((kind, _key(kind, request)))
+            if not entries:
+                raise LookupError(f"cassette에 기록되지 않은 {kind} 요청입니다: {request}")
+            # 도구 목록은 재연결 등으로 호출 횟수가 달라질 수 있으므로 마지막 기록을 계속 재사용
+            if kind == "tools" and len(entries) == 1:
+                return entries[0]
+            return entries.popleft()
+
+    def replay_sync(self, kind: str, request: Any = None) -> Any:
+        """기록된 응답을 원래 지연 시간(time_scale 적용)만큼 대기 후 반환합니다. (동기 호출용)"""
+        entry = self._next(kind, request)
+        time.sleep(entry["elapsed"] * self.time_scale)
+        return entry["response"]
+
+    async def replay(self, kind: str, request: Any = None) -> Any:
+        """기록된 응답을 원래 지연 시간(time_scale 적용)만큼 대기 후 반환합니다. (비동기 호출용)"""
+        entry = self._next(kind, request)
+        await asyncio.sleep(entry["elapsed"] * self.time_scale)
+        return entry["response"]
+
+    def close(self):
+        if self._writer:
+            _release_writer(self.path)
+            self._writer = None
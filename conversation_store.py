@@ -0,0 +1,219 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional, List, Dict, Any
+
+DEFAULT_DB_PATH = "./conversations.db"
+
+# 이 길이 이상의 본문은 별도 테이블에 저장하고 참조만 유지
+DEFAULT_PAYLOAD_THRESHOLD = 4096
+
+# 최근 메시지 캐시에 유지할 role (도구 결과가 대화 턴을 캐시에서 밀어내지 않도록 제외)
+CACHED_ROLES = ("user", "assistant")
+
+
+class ConversationStore:
+    """
+    SQLite 기반 대화 저장소.
+
+    모든 메시지는 디스크에 저장되고, 메모리에는 대화별 최근 user/assistant 메시지 몇 개와
+    최근 사용한 대화 몇 개만 유지합니다. 큰 본문(도구 결과 등)은 payloads 테이블에
+    저장되며 메시지에는 payload_ref만 남아 필요할 때 load_payload()로 읽습니다.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        recent_limit: int = 20,
+        max_conversations: int = 100,
+        payload_threshold: int = DEFAULT_PAYLOAD_THRESHOLD,
+    ):
+        self.recent_limit = recent_limit
+        self.max_conversations = max_conversations
+        self.payload_threshold = payload_threshold
+
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS payloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                name TEXT,
+                content TEXT,
+                payload_ref INTEGER REFERENCES payloads(id),
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_conversation
+                ON messages (conversation_id, id);
+        """)
+
+    def _row_to_message(self, row: sqlite3.Row) -> Dict[str, Any]:
+        message = {"id": row["id"], "role": row["role"], "content": row["content"]}
+        if row["name"]:
+            message["name"] = row["name"]
+        if row["payload_ref"] is not None:
+            message["payload_ref"] = row["payload_ref"]
+        return message
+
+    def _recent_cache(self, conversation_id: str) -> deque:
+        """대화의 최근 메시지 캐시를 반환합니다. 없으면 DB에서 읽어 채웁니다. (lock 보유 상태에서 호출)"""
+        if conversation_id in self._recent:
+            self._recent.move_to_end(conversation_id)
+            return self._recent[conversation_id]
+
+        rows = self.conn.execute(
+            f"SELECT * FROM messages WHERE conversation_id = ? AND role IN ({', '.join('?' for _ in CACHED_ROLES)}) "
+            "ORDER BY id DESC LIMIT ?",
+            (conversation_id, *CACHED_ROLES, self.recent_limit),
+        ).fetchall()
+        cache = deque((self._row_to_message(row) for row in reversed(rows)), maxlen=self.recent_limit)
+
+        self._recent[conversation_id] = cache
+        while len(self._recent) > self.max_conversations:
+            self._recent.popitem(last=False)
+        return cache
+
+    def append(self, conversation_id: str, role: str, content: str, name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        메시지를 저장합니다.
+
+        Args:
+            conversation_id (str): 대화 식별자
+            role (str): "user", "assistant", "tool"
+            content (str): 메시지 본문
+            name (str, optional): 도구 이름 (role이 "tool"인 경우) 또는 "error" (오류 응답). Defaults to None.
+
+        Returns:
+            dict: 저장된 메시지 (큰 본문은 content 대신 payload_ref 포함)
+        """
+        with self._lock, self.conn:
+            # INSERT 전에 캐시를 채워야 새 메시지가 DB 로드와 append로 두 번 들어가지 않음
+            cache = self._recent_cache(conversation_id)
+
+            payload_ref = None
+            if content is not None and len(content) >= self.payload_threshold:
+                payload_ref = self.conn.execute("INSERT INTO payloads (data) VALUES (?)", (content,)).lastrowid
+                content = None
+
+            message_id = self.conn.execute(
+                "INSERT INTO messages (conversation_id, role, name, content, payload_ref, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, role, name, content, payload_ref, time.time()),
+            ).lastrowid
+
+            message = {"id": message_id, "role": role, "content": content}
+            if name:
+                message["name"] = name
+            if payload_ref is not None:
+                message["payload_ref"] = payload_ref
+
+            if role in CACHED_ROLES:
+                cache.append(message)
+            return message
+
+    def load_payload(self, payload_ref: int) -> Optional[str]:
+        """payloads 테이블에 저장된 큰 본문을 읽습니다."""
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM payloads WHERE id = ?", (payload_ref,)).fetchone()
+        return row["data"] if row else None
+
+    def resolve(self, message: Dict[str, Any]) -> str:
+        """메시지 본문을 반환합니다. payload_ref가 있으면 디스크에서 읽습니다."""
+        if message.get("payload_ref") is not None:
+            return self.load_payload(message["payload_ref"])
+        return message["content"]
+
+    def recent(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """메모리에 유지되는 최근 user/assistant 메시지 목록을 반환합니다. (도구 결과는 history()로 조회)"""
+        with self._lock:
+            return list(self._recent_cache(conversation_id))
+
+    def history(
+        self,
+        conversation_id: str,
+        before_id: Optional[int] = None,
+        limit: int = 20,
+        roles: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        이전 메시지를 디스크에서 페이지 단위로 읽습니다. (메모리 캐시에는 올리지 않음)
+
+        Args:
+            conversation_id (str): 대화 식별자
+            before_id (int, optional): 이 id 이전의 메시지만 조회. Defaults to None.
+            limit (int, optional): 최대 개수. Defaults to 20.
+            roles (list, optional): 조회할 role 목록. Defaults to None (전체).
+
+        Returns:
+            list: 오래된 순으로 정렬된 메시지 목록
+        """
+        query = "SELECT * FROM messages WHERE conversation_id = ?"
+        params: list = [conversation_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        if roles:
+            query += f" AND role IN ({', '.join('?' for _ in roles)})"
+            params.extend(roles)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [self._row_to_message(row) for row in reversed(rows)]
+
+    def get_context(self, conversation_id: str, max_turns: int = 10) -> List[Dict[str, str]]:
+        """
+        process_query_stream의 history 인자로 전달할 최근 대화 문맥을 만듭니다.
+        도구 결과와 오류 응답은 제외하고 user/assistant 텍스트만 포함합니다.
+
+        Args:
+            conversation_id (str): 대화 식별자
+            max_turns (int, optional): 포함할 최대 메시지 수. Defaults to 10.
+
+        Returns:
+            list: [{"role": ..., "content": ...}] 목록
+        """
+        messages = [
+            message for message in self.recent(conversation_id)
+            if message["role"] in ("user", "assistant") and message.get("name") != "error"
+        ][-max_turns:]
+
+        # 모델 API 제약에 맞게 user로 시작하고 같은 role이 연속되지 않도록 정리
+        context = []
+        for message in messages:
+            content = self.resolve(message)
+            if not content or (not context and message["role"] != "user"):
+                continue
+            if context and context[-1]["role"] == message["role"]:
+                context[-1]["content"] += "\n\n" + content
+            else:
+                context.append({"role": message["role"], "content": content})
+
+        # 새 질의가 user로 추가되므로 응답 없이 끝난 user 턴은 제외
+        while context and context[-1]["role"] == "user":
+            context.pop()
+        return context
+
+    def clear(self, conversation_id: str):
+        """대화를 삭제합니다."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM payloads WHERE id IN "
+                "(SELECT payload_ref FROM messages WHERE conversation_id = ? AND payload_ref IS NOT NULL)",
+                (conversation_id,),
+            )
+            self.conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._recent.pop(conversation_id, None)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import os
+from typing import Optional, Dict, Any
+
+from dotenv import load_dotenv
+
+from mcp_gateway import load_servers
+
+# .env 파일 로드
+load_dotenv()
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+# 요청 본문과 헤더 개수 상한 (공유 서버의 메모리 보호)
+MAX_BODY_SIZE = 1024 * 1024
+MAX_HEADERS = 100
+
+# 전송 버퍼가 이 크기를 넘으면 drain()에서 대기하여 생성기 진행을 멈춤 (backpressure)
+WRITE_BUFFER_HIGH = 64 * 1024
+
+
+def create_client(provider: str, servers_config: dict, compact_results: bool = False):
+    """provider에 맞는 MCP 클라이언트를 생성합니다."""
+    if provider == "aws":
+        from aws_client import AwsClient
+        return AwsClient(servers_config, compact_results=compact_results)
+    if provider == "azure":
+        from azure_client import AzureClient
+        return AzureClient(servers_config, compact_results=compact_results)
+    raise ValueError(f"지원하지 않는 provider: {provider}")
+
+
+class RequestError(Exception):
+    """HTTP 오류 응답으로 돌려줄 요청 오류"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ClientDisconnected(ConnectionError):
+    """응답을 쓰는 중 소비자 연결이 끊기거나 쓰기 시간이 초과된 경우"""
+
+
+class QueryServer:
+    """
+    process_query_stream을 HTTP로 노출하는 서버.
+    하나의 클라이언트(MCP 세션, SDK 클라이언트)를 모든 요청이 공유합니다.
+
+    POST /query  {"query": "...", "conversation_id": "...", "history": [{"role": ..., "content": ...}]}
+      - Accept: text/event-stream 이면 Server-Sent Events
+      - 그 외에는 chunked NDJSON
+    GET /health
+    """
+
+    def __init__(self, client, max_concurrent: int = 4, queue_timeout: float = 30.0, write_timeout: float = 60.0):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.write_timeout = write_timeout
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            return None
+
+        parts = request_line.split(" ", 2)
+        if len(parts) != 3:
+            raise RequestError(400, "잘못된 요청 줄입니다.")
+        method, path, _ = parts
+        headers = {}
+        header_count = 0
+        while (line := (await reader.readline()).decode("latin-1").strip()):
+            header_count += 1
+            if header_count > MAX_HEADERS:
+                raise RequestError(431, "헤더가 너무 많습니다.")
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if "content-length" in headers:
+            try:
+                content_length = int(headers["content-length"])
+            except ValueError:
+                raise RequestError(400, "Content-Length가 올바르지 않습니다.")
+            if content_length < 0 or content_length > MAX_BODY_SIZE:
+                raise RequestError(413, f"요청 본문은 최대 {MAX_BODY_SIZE} bytes까지 허용됩니다.")
+            body = await reader.readexactly(content_length)
+
+        return method, path, headers, body
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _write_chunk(self, writer: asyncio.StreamWriter, data: bytes):
+        # 느린 소비자가 읽지 않으면 여기서 대기하고, 시간이 초과되면 스트림을 중단
+        # (질의 처리 중 발생한 연결 오류와 구분하기 위해 ClientDisconnected로 변환)
+        try:
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await asyncio.wait_for(writer.drain(), timeout=self.write_timeout)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            raise ClientDisconnected(str(e)) from e
+
+    async def _stream_query(
+        self,
+        writer: asyncio.StreamWriter,
+        query: str,
+        conversation_id: Optional[str],
+        history: Optional[list],
+        sse: bool,
+    ):
+        content_type = "text/event-stream" if sse else "application/x-ndjson"
+        writer.write(
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Cache-Control: no-cache\r\n"
+            f"Transfer-Encoding: chunked\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1")
+        )
+
+        stream = self.client.process_query_stream(query, conversation_id, history)
+        try:
+            async for chunk in stream:
+                data = json.dumps(chunk, ensure_ascii=False)
+                if sse:
+                    payload = f"event: {chunk['type']}\ndata: {data}\n\n"
+                else:
+                    payload = data + "\n"
+                await self._write_chunk(writer, payload.encode("utf-8"))
+        except ClientDisconnected:
+            raise
+        except Exception as e:
+            error = json.dumps({"type": "error", "message": f"오류 발생: {str(e)}"}, ensure_ascii=False)
+            payload = f"event: error\ndata: {error}\n\n" if sse else error + "\n"
+            await self._write_chunk(writer, payload.encode("utf-8"))
+        finally:
+            await stream.aclose()
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _handle_query(self, writer: asyncio.StreamWriter, headers: dict, body: bytes):
+        try:
+            payload = json.loads(body or b"{}")
+            query = payload["query"]
+        except (ValueError, KeyError):
+            await self._send_json(writer, 400, {"error": "요청 본문에 query가 필요합니다."})
+            return
+
+        # 동시 처리 수 제한
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            await self._send_json(writer, 503, {"error": "처리 중인 요청이 많습니다. 잠시 후 다시 시도하세요."})
+            return
+
+        try:
+            sse = "text/event-stream" in headers.get("accept", "")
+            await self._stream_query(writer, query, payload.get("conversation_id"), payload.get("history"), sse)
+        finally:
+            self.semaphore.release()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        try:
+            try:
+                request = await self._read_request(reader)
+            except RequestError as e:
+                await self._send_json(writer, e.status, {"error": str(e)})
+                return
+            if request is None:
+                return
+
+            method, path, headers, body = request
+            if path == "/health":
+                await self._send_json(writer, 200, {"status": "ok"})
+            elif path == "/query":
+                if method != "POST":
+                    await self._send_json(writer, 405, {"error": "POST만 지원합니다."})
+                else:
+                    await self._handle_query(writer, headers, body)
+            else:
+                await self._send_json(writer, 404, {"error": "존재하지 않는 경로입니다."})
+        except (ConnectionError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            # 클라이언트 연결 종료 또는 느린 소비자
+            pass
+        finally:
+            writer.close()
+
+
+async def main(provider: str, config_path: str, host: str, port: int, max_concurrent: int, compact_results: bool):
+    servers_config = {
+        name: config for name, config in load_servers(config_path).items() if "command" in config
+    }
+    client = create_client(provider, servers_config, compact_results)
+
+    async with client:
+        query_server = QueryServer(client, max_concurrent=max_concurrent)
+        server = await asyncio.start_server(query_server.handle_connection, host, port)
+        print(f"[http] {provider} 클라이언트로 http://{host}:{port} 에서 대기 중")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="process_query_stream을 HTTP 스트리밍으로 제공하는 서버")
+    parser.add_argument("--provider", choices=["aws", "azure"], default="aws", help="사용할 모델 제공자")
+    parser.add_argument("--config", default="./mcp_config.json", help="MCP 서버 설정 파일 경로")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_HTTP_PORT", "8080")))
+    parser.add_argument("--max-concurrent", type=int, default=4, help="동시에 처리할 최대 질의 수")
+    parser.add_argument("--compact-results", action="store_true", help="JSON 도구 결과를 압축하여 모델에 전달")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.provider, args.config, args.host, args.port, args.max_concurrent, args.compact_results))
+    except KeyboardInterrupt:
+        pass
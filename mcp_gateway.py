@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+from typing import Optional, Dict, Any
+from contextlib import AsyncExitStack
+
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.stdio import stdio_client
+
+DEFAULT_SOCKET_PATH = "/tmp/mcp-gateway.sock"
+
+# 도구 결과가 큰 경우를 위해 한 줄(메시지) 최대 크기를 늘림
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class McpGateway:
+    """
+    mcp_config.json에 정의된 MCP 서버 세션을 소유하고,
+    여러 클라이언트 프로세스의 요청을 Unix 소켓으로 받아 처리하는 게이트웨이
+    """
+
+    def __init__(self, servers_config: dict):
+        self.server_configs = servers_config
+        self.clients: Dict[str, ClientSession] = {}
+        self.exit_stack = AsyncExitStack()
+
+    async def connect_to_server(self):
+        """설정된 모든 stdio MCP 서버에 연결"""
+        for server_name, config in self.server_configs.items():
+            if "command" not in config:
+                print(f"[gateway] stdio 서버가 아니므로 건너뜀: {server_name}")
+                continue
+
+            server_params = StdioServerParameters(
+                command=config["command"],
+                args=config.get("args", []),
+                env=config.get("env", None)
+            )
+
+            # 서버별로 정리 스택을 분리하여 한 서버의 실패가 다른 서버에 영향을 주지 않도록 함
+            server_stack = AsyncExitStack()
+            try:
+                read, write = await server_stack.enter_async_context(stdio_client(server_params))
+                session = await server_stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+            except Exception as e:
+                await server_stack.aclose()
+                print(f"[gateway] 서버 연결 실패, 건너뜀: {server_name} ({str(e)})")
+                continue
+
+            self.exit_stack.push_async_callback(server_stack.aclose)
+            self.clients[server_name] = session
+            print(f"[gateway] 서버 연결 완료: {server_name}")
+
+    async def _dispatch(self, method: str, params: dict) -> Any:
+        if method == "list_servers":
+            return list(self.clients.keys())
+
+        session = self.clients.get(params.get("server"))
+        if session is None:
+            raise ValueError(f"알 수 없는 서버: {params.get('server')}")
+
+        if method == "list_tools":
+            result = await session.list_tools()
+        elif method == "call_tool":
+            result = await session.call_tool(params["name"], arguments=params.get("arguments"))
+        else:
+            raise ValueError(f"알 수 없는 메소드: {method}")
+
+        return result.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+    async def _handle_request(self, request: dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        response = {"id": request.get("id")}
+        try:
+            response["result"] = await self._dispatch(request.get("method"), request.get("params", {}))
+        except Exception as e:
+            response["error"] = str(e)
+
+        async with write_lock:
+            writer.write(_encode(response))
+            await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 하나의 연결에서 여러 요청을 동시에 처리 (응답은 id로 구분)
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                task = asyncio.create_task(self._handle_request(request, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: 잘못된 JSON 또는 STREAM_LIMIT를 넘거나 끝나지 않은 줄
+            print(f"[gateway] 연결 처리 중 오류: {str(e)}")
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def serve(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        """Unix 소켓에서 요청을 받아 처리"""
+        if os.path.exists(socket_path):
+            # 다른 게이트웨이가 사용 중인 소켓은 가로채지 않고, 남아 있는 소켓 파일만 정리
+            try:
+                _, writer = await asyncio.open_unix_connection(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                writer.close()
+                raise RuntimeError(f"이미 실행 중인 게이트웨이가 있습니다: {socket_path}")
+
+        server = await asyncio.start_unix_server(self._handle_connection, path=socket_path, limit=STREAM_LIMIT)
+        print(f"[gateway] {socket_path}에서 대기 중 ({len(self.clients)}개 서버)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    async def close_all(self):
+        await self.exit_stack.aclose()
+
+
+class GatewayConnection:
+    """게이트웨이 데몬에 대한 클라이언트 측 연결. 여러 요청을 하나의 소켓으로 다중화합니다."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        self.socket_path = socket_path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path, limit=STREAM_LIMIT)
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def _ensure_connected(self):
+        """연결이 끊겼으면 (게이트웨이 재시작 등) 다시 연결합니다."""
+        async with self._connect_lock:
+            if self._reader_task is not None and not self._reader_task.done():
+                return
+            if self.writer:
+                self.writer.close()
+            await self.connect()
+
+    async def _read_responses(self):
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except (ConnectionError, ValueError):
+            # ValueError: 잘못된 JSON 또는 STREAM_LIMIT를 넘거나 끝나지 않은 줄 (연결을 끊고 재연결)
+            if self.writer:
+                self.writer.close()
+        finally:
+            # 연결이 끊기면 대기 중인 요청을 모두 실패 처리
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("게이트웨이 연결이 종료되었습니다."))
+            self._pending.clear()
+
+    async def request(self, method: str, params: Optional[dict] = None) -> Any:
+        await self._ensure_connected()
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        try:
+            async with self._write_lock:
+                self.writer.write(_encode({"id": request_id, "method": method, "params": params or {}}))
+                await self.writer.drain()
+        except BaseException:
+            # 전송에 실패한 요청은 응답을 기다리지 않음
+            self._pending.pop(request_id, None)
+            raise
+
+        try:
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def list_servers(self) -> list:
+        return await self.request("list_servers")
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+        if self._reader_task:
+            self._reader_task.cancel()
+
+
+class GatewaySession:
+    """
+    게이트웨이를 통해 특정 MCP 서버를 호출하는 ClientSession 대체 객체.
+    list_tools / call_tool만 제공하며 결과는 mcp 타입으로 복원됩니다.
+    """
+
+    def __init__(self, connection: GatewayConnection, server_name: str):
+        self.connection = connection
+        self.server_name = server_name
+
+    async def list_tools(self) -> types.ListToolsResult:
+        result = await self.connection.request("list_tools", {"server": self.server_name})
+        return types.ListToolsResult.model_validate(result)
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None) -> types.CallToolResult:
+        result = await self.connection.request("call_tool", {
+            "server": self.server_name,
+            "name": name,
+            "arguments": arguments,
+        })
+        return types.CallToolResult.model_validate(result)
+
+
+def load_servers(config_path: str) -> dict:
+    """MCP 설정 파일에서 mcpServers 항목을 읽습니다."""
+    with open(config_path, "r") as f:
+        return json.load(f).get("mcpServers", {})
+
+
+async def main(config_path: str, socket_path: str):
+    gateway = McpGateway(load_servers(config_path))
+    try:
+        await gateway.connect_to_server()
+        await gateway.serve(socket_path)
+    finally:
+        await gateway.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MCP 서버 세션을 공유하는 게이트웨이 데몬")
+    parser.add_argument("--config", default="./mcp_config.json", help="MCP 서버 설정 파일 경로")
+    parser.add_argument("--socket", default=os.getenv("MCP_GATEWAY_SOCKET", DEFAULT_SOCKET_PATH), help="Unix 소켓 경로")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.config, args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,112 @@
+import json
+from typing import List, Dict, Any
+
+from blob_store import BlobStore, describe_blob
+
+# 이 길이 이상인 JSON 결과만 압축 (작은 결과는 원본 유지)
+DEFAULT_COMPACT_THRESHOLD = 1024
+
+# 압축된 객체 배열을 원래 데이터와 구분하기 위한 표식 키
+COMPACT_TABLE_KEY = "$table"
+
+# 압축 결과를 사용할 때 시스템 프롬프트에 추가하는 형식 설명
+COMPACT_RESULTS_PROMPT = (
+    f'도구 결과 JSON에서 {{"{COMPACT_TABLE_KEY}": {{"columns": [...], "rows": [[...], ...]}}}} 형태의 객체는 '
+    "압축된 객체 배열입니다. rows의 각 행은 columns 순서대로 값을 나열한 하나의 객체를 의미합니다."
+)
+
+
+def extract_content_parts(result: Any, blob_store: BlobStore) -> List[Dict[str, Any]]:
+    """
+    MCP 도구 결과의 모든 content 블록을 파트 목록으로 변환합니다.
+
+    텍스트와 텍스트 리소스는 {"type": "text", "text": ...}로, 이미지/오디오와 blob 리소스는
+    blob_store에 한 번만 디코딩하여 저장하고 {"type": "blob", "handle": ...} 참조로 반환합니다.
+
+    Args:
+        result: MCP call_tool 결과
+        blob_store (BlobStore): 바이너리 데이터를 저장할 저장소
+
+    Returns:
+        list: 블록별 파트 (content가 없으면 결과 전체의 문자열 표현)
+    """
+    content = getattr(result, "content", None)
+    if not content:
+        return [{"type": "text", "text": str(result)}]
+
+    parts = []
+    for block in content:
+        block_type = getattr(block, "type", None)
+        if hasattr(block, "text"):
+            parts.append({"type": "text", "text": block.text})
+        elif block_type in ("image", "audio") and hasattr(block, "data"):
+            parts.append(blob_store.put_base64(block.data, block.mimeType))
+        elif block_type == "resource":
+            resource = block.resource
+            if hasattr(resource, "text"):
+                parts.append({"type": "text", "text": resource.text})
+            else:
+                parts.append(blob_store.put_base64(resource.blob, resource.mimeType, uri=str(resource.uri)))
+        else:
+            parts.append({"type": "text", "text": str(block)})
+    return parts
+
+
+def parts_to_text(parts: List[Dict[str, Any]], include_handles: bool = True) -> str:
+    """
+    파트 목록을 표시/기록용 텍스트로 변환합니다. blob은 핸들 참조로 표현됩니다.
+    대화 저장소처럼 클라이언트보다 오래 남는 기록에는 include_handles=False로 핸들을 제외합니다.
+    """
+    return "\n".join(
+        part["text"] if part["type"] == "text" else describe_blob(part, include_handles) for part in parts
+    )
+
+
+def _compact_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _compact_value(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        items = [_compact_value(item) for item in value]
+        # 키 구성이 모두 같은 객체 배열만 헤더 행 + 값 행으로 변환하여 키 반복을 제거
+        # (키가 다르면 누락과 null을 구분할 수 없으므로 원래 형태 유지)
+        # 원래 데이터와 구분되도록 COMPACT_TABLE_KEY로 감싸며, 형식은 COMPACT_RESULTS_PROMPT로 모델에 설명
+        if len(items) >= 2 and all(isinstance(item, dict) for item in items):
+            columns = list(items[0])
+            if all(item.keys() == items[0].keys() for item in items[1:]):
+                return {
+                    COMPACT_TABLE_KEY: {
+                        "columns": columns,
+                        "rows": [[item[key] for key in columns] for item in items],
+                    }
+                }
+        return items
+
+    return value
+
+
+def compact_text(text: str, threshold: int = DEFAULT_COMPACT_THRESHOLD) -> str:
+    """
+    JSON 형식의 도구 결과를 모델 프롬프트용 압축 형식으로 변환합니다.
+
+    키 구성이 같은 객체 배열은 (중첩된 배열 포함) {"$table": {"columns": [...], "rows": [[...], ...]}}
+    형태로 바꾸고, 공백 없이 직렬화합니다. 모델에는 COMPACT_RESULTS_PROMPT로 형식을 알려야 합니다. JSON이 아니거나 threshold보다 짧거나,
+    변환 결과가 더 길어지면 원본을 그대로 반환합니다.
+
+    Args:
+        text (str): 도구 결과 텍스트
+        threshold (int, optional): 압축을 시도할 최소 길이. Defaults to DEFAULT_COMPACT_THRESHOLD.
+
+    Returns:
+        str: 압축된 텍스트 또는 원본
+    """
+    if len(text) < threshold or text.lstrip()[:1] not in ("{", "["):
+        return text
+
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+
+    encoded = json.dumps(_compact_value(value), ensure_ascii=False, separators=(",", ":"))
+    return encoded if len(encoded) < len(text) else text
@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Optional, List, Dict, Any
+
+
+def _empty_totals() -> Dict[str, int]:
+    return {
+        "calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cached_tokens": 0,
+    }
+
+
+def _add(totals: Dict[str, int], input_tokens: int, output_tokens: int, cached_tokens: int):
+    totals["calls"] += 1
+    totals["input_tokens"] += input_tokens
+    totals["output_tokens"] += output_tokens
+    totals["cached_tokens"] += cached_tokens
+
+
+# 프로세스 전체 누적 사용량 (모든 클라이언트 공유)
+_process_lock = threading.Lock()
+_process_totals: Dict[str, int] = _empty_totals()
+
+
+def get_process_usage() -> Dict[str, int]:
+    """현재 프로세스의 누적 토큰 사용량을 반환합니다."""
+    with _process_lock:
+        return dict(_process_totals)
+
+
+class UsageTracker:
+    """모델 호출별 토큰 사용량을 대화 단위로 기록하고 집계하는 클래스"""
+
+    def __init__(self, max_conversations: int = 1000, max_calls: int = 100):
+        self._lock = threading.Lock()
+        # 최근 사용한 대화만 유지하고, 대화별 호출 기록도 최근 max_calls개만 유지
+        self.max_conversations = max_conversations
+        self.max_calls = max_calls
+        self.conversations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.totals = _empty_totals()
+
+    def record(
+        self,
+        conversation_id: str,
+        iteration: int,
+        input_tokens: int,
+        output_tokens: int,
+        cached_tokens: int = 0,
+        tool_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        모델 호출 한 번의 사용량을 기록합니다.
+
+        Args:
+            conversation_id (str): 대화 식별자
+            iteration (int): process_query_stream 루프 반복 번호 (0부터 시작)
+            input_tokens (int): 입력 토큰 수
+            output_tokens (int): 출력 토큰 수
+            cached_tokens (int, optional): 캐시에서 읽은 입력 토큰 수. Defaults to 0.
+            tool_results (list, optional): 직전 호출 이후 프롬프트에 추가된 도구 결과 목록
+                ({"name": 도구 이름, "chars": 결과 길이}). Defaults to None.
+
+        Returns:
+            dict: process_query_stream에서 그대로 내보낼 수 있는 usage 이벤트
+        """
+        tool_results = list(tool_results or [])
+
+        with self._lock:
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self.conversations[conversation_id] = {
+                    "totals": _empty_totals(),
+                    "calls": deque(maxlen=self.max_calls),
+                    "tools": {},
+                }
+                while len(self.conversations) > self.max_conversations:
+                    self.conversations.popitem(last=False)
+            else:
+                self.conversations.move_to_end(conversation_id)
+
+            # 직전 호출 대비 입력 토큰 증가분을 새로 추가된 도구 결과에 배분
+            calls = conversation["calls"]
+            previous_input = calls[-1]["input_tokens"] if calls else 0
+            input_growth = max(input_tokens - previous_input, 0) if calls and iteration > 0 else 0
+            total_chars = sum(item["chars"] for item in tool_results)
+            for item in tool_results:
+                share = input_growth * item["chars"] // total_chars if total_chars else 0
+                tool_stats = conversation["tools"].setdefault(item["name"], {
+                    "results": 0,
+                    "chars": 0,
+                    "input_tokens": 0,
+                })
+                tool_stats["results"] += 1
+                tool_stats["chars"] += item["chars"]
+                tool_stats["input_tokens"] += share
+
+            call = {
+                "iteration": iteration,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cached_tokens": cached_tokens,
+                "input_growth": input_growth,
+                "tool_results": tool_results,
+            }
+            calls.append(call)
+
+            _add(conversation["totals"], input_tokens, output_tokens, cached_tokens)
+            _add(self.totals, input_tokens, output_tokens, cached_tokens)
+            conversation_totals = dict(conversation["totals"])
+
+        with _process_lock:
+            _add(_process_totals, input_tokens, output_tokens, cached_tokens)
+
+        return {
+            "type": "usage",
+            "conversation_id": conversation_id,
+            **call,
+            "conversation_totals": conversation_totals,
+        }
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """대화별 누적 사용량, 호출 기록, 도구별 집계를 반환합니다."""
+        with self._lock:
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                return None
+            return {
+                "totals": dict(conversation["totals"]),
+                "calls": list(conversation["calls"]),
+                "tools": {name: dict(stats) for name, stats in conversation["tools"].items()},
+            }
+
+    def get_totals(self) -> Dict[str, int]:
+        """이 클라이언트에서 발생한 모든 호출의 누적 사용량을 반환합니다."""
+        with self._lock:
+            return dict(self.totals)
+
+    def reset(self, conversation_id: str):
+        """대화의 사용량 기록을 삭제합니다."""
+        with self._lock:
+            self.conversations.pop(conversation_id, None)
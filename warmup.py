@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Optional, List, Dict, Any, Callable
+
+DEFAULT_CATALOG_PATH = "./tool_catalog.json"
+
+
+def config_fingerprint(servers_config: dict) -> str:
+    """서버 구성이 바뀌었는지 확인하기 위한 해시"""
+    # 앱(create_server_config)과 mcp_config.json 원본이 같은 값을 갖도록 연결에 필요한 항목만 사용
+    normalized = {
+        server_name: {
+            "command": config.get("command"),
+            "args": config.get("args") or [],
+            "env": config.get("env") or None,
+            "url": config.get("url"),
+        }
+        for server_name, config in servers_config.items()
+    }
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def load_tool_catalog(servers_config: dict, provider: str, path: str = DEFAULT_CATALOG_PATH) -> Optional[Dict[str, Any]]:
+    """
+    디스크에 저장된 도구 목록 스냅샷을 읽습니다.
+
+    Args:
+        servers_config (dict): 현재 서버 구성
+        provider (str): 도구 정의 형식을 결정하는 모델 제공자 ("aws", "azure")
+        path (str, optional): 스냅샷 파일 경로. Defaults to DEFAULT_CATALOG_PATH.
+
+    Returns:
+        dict: {"tools": [도구 정의], "mapping": {도구 이름: 서버 이름}, "updated_at": ...}
+            (없거나 구성/제공자가 다르면 None)
+    """
+    try:
+        with open(path, "r") as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if catalog.get("fingerprint") != config_fingerprint(servers_config) or catalog.get("provider") != provider:
+        return None
+    return catalog
+
+
+def save_tool_catalog(servers_config: dict, provider: str, tools: List[dict], mapping: Dict[str, str], path: str = DEFAULT_CATALOG_PATH):
+    """
+    도구 목록 스냅샷을 디스크에 저장합니다. (원자적 교체)
+
+    Args:
+        servers_config (dict): 현재 서버 구성
+        provider (str): 도구 정의 형식을 결정하는 모델 제공자 ("aws", "azure")
+        tools (list): 클라이언트의 list_all_tools() 결과
+        mapping (dict): 클라이언트의 tool_mapping (도구 이름 -> 서버 이름)
+        path (str, optional): 스냅샷 파일 경로. Defaults to DEFAULT_CATALOG_PATH.
+    """
+    catalog = {
+        "fingerprint": config_fingerprint(servers_config),
+        "provider": provider,
+        "updated_at": time.time(),
+        "tools": tools,
+        "mapping": mapping,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _npx_package(config: dict) -> Optional[str]:
+    if os.path.basename(config.get("command") or "") not in ("npx", "npx.cmd"):
+        return None
+    for arg in config.get("args", []):
+        if not arg.startswith("-"):
+            return arg
+    return None
+
+
+def prefetch_npm_packages(servers_config: dict, timeout: float = 300):
+    """
+    npx로 실행되는 서버 패키지를 미리 내려받아 npx 캐시에 둡니다.
+    서버를 실행하지 않고 설치만 하므로 첫 연결 시 다운로드 대기를 줄입니다.
+    게이트웨이(MCP_GATEWAY_SOCKET)를 사용하면 서버를 게이트웨이가 실행하므로 건너뜁니다.
+    """
+    if os.getenv("MCP_GATEWAY_SOCKET"):
+        return
+
+    processes = []
+    for server_name, config in servers_config.items():
+        package = _npx_package(config)
+        if not package:
+            continue
+        processes.append((server_name, subprocess.Popen(
+            [config["command"], "-y", f"--package={package}", "--", "node", "--version"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, **(config.get("env") or {})},
+        )))
+
+    # 패키지 다운로드는 동시에 진행
+    deadline = time.monotonic() + timeout
+    for server_name, process in processes:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            print(f"[warmup] 패키지 미리 받기 시간 초과: {server_name}")
+
+
+class ClientWarmer:
+    """
+    프로세스 시작 시 백그라운드 스레드에서 MCP 서버 연결을 미리 준비하는 클래스
+
+    전용 이벤트 루프에서 클라이언트를 연결해 둡니다. keep_spare가 True이면 세션이 claim()으로
+    가져간 뒤 다음 세션을 위해 새 클라이언트를 다시 준비합니다. (서버 프로세스가 하나 더 유지됨)
+    연결한 서버의 도구 목록은 디스크 스냅샷으로 저장되어, 연결이 끝나기 전에 들어온 질의도
+    클라이언트의 connect_in_background()로 스냅샷을 사용해 바로 시작할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[dict], Any],
+        servers_config: dict,
+        provider: str,
+        catalog_path: str = DEFAULT_CATALOG_PATH,
+        keep_spare: bool = False,
+    ):
+        self.client_factory = client_factory
+        self.servers_config = servers_config
+        self.provider = provider
+        self.catalog_path = catalog_path
+        self.keep_spare = keep_spare
+        self._lock = threading.Lock()
+        self._future: Optional[concurrent.futures.Future] = None
+        self._prefetched = False
+
+    def _warm(self):
+        if not self._prefetched:
+            prefetch_npm_packages(self.servers_config)
+            self._prefetched = True
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        client = self.client_factory(self.servers_config)
+        try:
+            loop.run_until_complete(client.connect_to_server())
+            tools = loop.run_until_complete(client.list_all_tools())
+        except Exception:
+            loop.run_until_complete(client.close_all())
+            loop.close()
+            raise
+
+        try:
+            save_tool_catalog(self.servers_config, self.provider, tools, dict(client.tool_mapping), self.catalog_path)
+        except OSError as e:
+            print(f"[warmup] 도구 목록 스냅샷 저장 실패: {str(e)}")
+        return loop, client, tools
+
+    def _run(self, future: concurrent.futures.Future):
+        try:
+            future.set_result(self._warm())
+        except Exception as e:
+            future.set_exception(e)
+
+    def start(self):
+        """백그라운드에서 클라이언트 준비를 시작합니다. (이미 진행 중이면 무시)"""
+        with self._lock:
+            if self._future is not None:
+                return
+            self._future = concurrent.futures.Future()
+            threading.Thread(target=self._run, args=(self._future,), name="mcp-warmup", daemon=True).start()
+
+    def claim(self, timeout: Optional[float] = 0):
+        """
+        준비된 클라이언트를 가져갑니다.
+
+        Args:
+            timeout (float, optional): 준비가 끝날 때까지 기다릴 시간(초). None이면 끝까지 대기. Defaults to 0.
+
+        Returns:
+            tuple: (이벤트 루프, 클라이언트, 도구 목록). 아직 준비되지 않았으면 None.
+                준비 중 오류가 발생했으면 해당 예외를 다시 발생시킵니다.
+        """
+        with self._lock:
+            future = self._future
+        if future is None:
+            self.start()
+            return None
+
+        try:
+            result = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            return None
+        finally:
+            if future.done():
+                with self._lock:
+                    if self._future is future:
+                        self._future = None
+
+        # 다음 세션을 위해 다시 준비 (실패한 경우에는 다음 claim() 호출 때 재시도)
+        if self.keep_spare:
+            self.start()
+        return result
+
+
+if __name__ == "__main__":
+    from http_server import create_client
+    from mcp_gateway import load_servers
+
+    parser = argparse.ArgumentParser(description="npx 패키지를 미리 받고 도구 목록 스냅샷을 갱신합니다.")
+    parser.add_argument("--provider", choices=["aws", "azure"], default="aws", help="도구 정의 형식을 결정할 모델 제공자")
+    parser.add_argument("--config", default="./mcp_config.json", help="MCP 서버 설정 파일 경로")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="도구 목록 스냅샷 경로")
+    args = parser.parse_args()
+
+    servers_config = load_servers(args.config)
+    prefetch_npm_packages(servers_config)
+
+    async def refresh_catalog():
+        client = create_client(args.provider, servers_config)
+        try:
+            await client.connect_to_server()
+            tools = await client.list_all_tools()
+            save_tool_catalog(servers_config, args.provider, tools, dict(client.tool_mapping), args.catalog)
+        finally:
+            await client.close_all()
+
+    asyncio.run(refresh_catalog())